@@ -8,10 +8,11 @@ This module implements a storage fee management system that:
 4. Maintains monthly statistics for billing
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from decimal import Decimal
 import math
-from typing import Dict, Tuple 
+from functools import lru_cache
+from typing import Dict, List, Tuple 
 from dataclasses import dataclass, field 
 from collections import defaultdict
 import sys
@@ -40,6 +41,81 @@ STORAGE_UNITS = {
     'storage_B2': StorageUnit('B', Decimal('0.0001'), Decimal('0.5'), False)
 }
 
+# Position of each storage unit in the per-unit lists of MonthlyStats and STORAGE_FEE_TERMS
+STORAGE_INDEX: Dict[str, int] = {s_name: idx for idx, s_name in enumerate(STORAGE_UNITS)}
+
+# Storage sizes are tracked in KB and billed per started MB
+KB_TO_MB_DIVISOR = 1000
+
+# Exact integer ratios of the fees above, as (store_num, store_den, update_num, update_den).
+# Fee arithmetic on the hot path uses these instead of allocating Decimals.
+STORAGE_NUM_DEN: Dict[str, Tuple[int, int, int, int]] = {
+    s_name: s_unit.store_fee_per_mb.as_integer_ratio() + s_unit.update_fee_per_mb.as_integer_ratio()
+    for s_name, s_unit in STORAGE_UNITS.items()
+}
+
+# Common denominator of all fees; unrounded fees are summed in these units for the usage fee
+FEE_SCALE = math.lcm(*(ratio[i] for ratio in STORAGE_NUM_DEN.values() for i in (1, 3)))
+
+# Per-unit constants for _unit_fees in STORAGE_INDEX order: each fee ratio followed by its numerator
+# rescaled to FEE_SCALE, as (store_num, store_den, store_scaled_num, update_num, update_den, update_scaled_num)
+STORAGE_FEE_TERMS: Tuple[Tuple[int, int, int, int, int, int], ...] = tuple(
+    (store_num, store_den, store_num * (FEE_SCALE // store_den),
+     update_num, update_den, update_num * (FEE_SCALE // update_den))
+    for store_num, store_den, update_num, update_den in STORAGE_NUM_DEN.values()
+)
+
+# Successful command responses: storage, update and usage fees (CALC first reports sizes)
+UPLOAD_RESPONSE = "UPLOAD: %d %d %d"
+DELETE_RESPONSE = "DELETE: %d %d %d"
+UPDATE_RESPONSE = "UPDATE: %d %d %d"
+CALC_RESPONSE = "CALC: [%d %d %d %d] %d %d %d"
+
+@lru_cache(maxsize=64)
+def _month_key(year: int, month: int) -> str:
+    """
+    Generate the monthly statistics key for a year and month.
+    Format: YYYY-MM
+    """
+    return f"{year}-{month:02d}"
+
+@lru_cache(maxsize=64)
+def _prev_month_key(year: int, month: int) -> str:
+    """
+    Generate the monthly statistics key for the month before the given one.
+    """
+    return _month_key(year - 1, 12) if month == 1 else _month_key(year, month - 1)
+
+def _unit_fees(fee_terms: Tuple[int, int, int, int, int, int],
+               max_size_kb: int, update_kb_sum: int) -> Tuple[int, int, int, int]:
+    """
+    Calculate a single storage unit's fees for the given usage.
+    
+    Args:
+        fee_terms: The unit's entry in STORAGE_FEE_TERMS
+        max_size_kb: Maximum storage size used in the month (in KB)
+        update_kb_sum: Total size of update operations in the month (in KB)
+        
+    Returns:
+        Tuple of (storage_fee, update_fee, storage_fee_scaled, update_fee_scaled),
+        where the scaled fees are unrounded and in 1/FEE_SCALE units
+    """
+    store_num, store_den, store_scaled_num, update_num, update_den, update_scaled_num = fee_terms
+    storage_fee = update_fee = storage_fee_scaled = update_fee_scaled = 0
+
+    # Ceiling divisions on ints: (a + b - 1) // b for KB to MB, -(-a // b) for fees
+    if max_size_kb > 0:
+        s_mb = (max_size_kb + KB_TO_MB_DIVISOR - 1) // KB_TO_MB_DIVISOR
+        storage_fee = -(-(s_mb * store_num) // store_den)
+        storage_fee_scaled = s_mb * store_scaled_num
+
+    if update_kb_sum > 0:
+        u_mb = (update_kb_sum + KB_TO_MB_DIVISOR - 1) // KB_TO_MB_DIVISOR
+        update_fee = -(-(u_mb * update_num) // update_den)
+        update_fee_scaled = u_mb * update_scaled_num
+
+    return storage_fee, update_fee, storage_fee_scaled, update_fee_scaled
+
 @dataclass
 class File:
     """
@@ -54,17 +130,33 @@ class File:
     size: int
     storage: str
 
-@dataclass
+def _per_unit_zeros() -> List[int]:
+    """Create a zeroed list with one entry per storage unit."""
+    return [0] * len(STORAGE_INDEX)
+
+@dataclass(slots=True)
 class MonthlyStats:
     """
-    Tracks monthly statistics for a storage unit.
+    Tracks a month's statistics for all storage units.
+    
+    Each per-unit attribute is a list with one entry per storage unit, in STORAGE_INDEX order.
     
     Attributes:
         max_size: Maximum storage size used in the month (in KB)
         update_kb_sum: Total size of update operations in the month (in KB)
+        storage_fee: Integer storage fee last added to the month's running totals
+        update_fee: Integer update fee last added to the month's running totals
+        storage_fee_scaled: Unrounded storage fee in 1/FEE_SCALE units, for the usage fee
+        update_fee_scaled: Unrounded update fee in 1/FEE_SCALE units, for the usage fee
+        update_fee_settled: Whether a CALC has settled the month's update fees
     """
-    max_size: int = 0 
-    update_kb_sum: int = 0
+    max_size: List[int] = field(default_factory=_per_unit_zeros)
+    update_kb_sum: List[int] = field(default_factory=_per_unit_zeros)
+    storage_fee: List[int] = field(default_factory=_per_unit_zeros)
+    update_fee: List[int] = field(default_factory=_per_unit_zeros)
+    storage_fee_scaled: List[int] = field(default_factory=_per_unit_zeros)
+    update_fee_scaled: List[int] = field(default_factory=_per_unit_zeros)
+    update_fee_settled: bool = False
 
 class StorageManager:
     """
@@ -85,42 +177,72 @@ class StorageManager:
         self.is_free_plan = is_free_plan
         self.files: Dict[str, File] = {}
         self.current_storage_size: Dict[str, int] = defaultdict(int)
-        self.monthly_stats: Dict[str, Dict[str, MonthlyStats]] = {}
-        self.calc_reported_sizes_snapshot: Dict[str, Dict[str, int]] = {}
-        self.KB_TO_MB_DIVISOR = 1000
-        self.update_fee_settled_for_month: set[str] = set()
+        self.monthly_stats: Dict[str, MonthlyStats] = {}
+        # Running fee totals per month over the active storage units:
+        # [storage_fee, update_fee, storage_fee_scaled, update_fee_scaled]
+        self._month_fee_totals: Dict[str, List[int]] = {}
+        # Bumped on every change affecting a month's fees; keys the cached results below
+        self._month_version: Dict[str, int] = defaultdict(int)
+        self._fee_cache: Dict[str, Tuple[int, Dict[str, int]]] = {}
+        # Storage sizes reported by CALC per month, in STORAGE_INDEX order
+        self.calc_reported_sizes_snapshot: Dict[str, Tuple[int, ...]] = {}
         # Stores the actual storage sizes at the end of each month for initialization
-        self.last_month_eom_storage_sizes: Dict[str, int] = defaultdict(int)
-
-    def _get_month_key(self, timestamp: datetime) -> str:
-        """
-        Generate a key for monthly statistics based on timestamp.
-        Format: YYYY-MM
-        """
-        return f"{timestamp.year}-{timestamp.month:02d}"
-
-    def _get_previous_month_key(self, timestamp: datetime) -> str:
-        """
-        Generate a key for the previous month's statistics.
-        Used for CALC operations which report on the previous month.
-        """
-        current_month_start = timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        prev_month_end = current_month_start - timedelta(days=1)
-        return self._get_month_key(prev_month_end)
+        self.last_month_eom_storage_sizes: List[int] = _per_unit_zeros()
+        # Storage units usable under this plan, mapped to their STORAGE_INDEX positions;
+        # only these count towards fees
+        self._plan_storage_index: Dict[str, int] = {
+            s_name: STORAGE_INDEX[s_name]
+            for s_name, s_unit in STORAGE_UNITS.items()
+            if not is_free_plan or s_unit.is_free_plan_allowed
+        }
+        self._active_units: Tuple[int, ...] = tuple(self._plan_storage_index.values())
 
-    def _ensure_month_init(self, month_key: str):
+    def _ensure_month_init(self, month_key: str) -> MonthlyStats:
         """
         Initialize monthly statistics if not already present.
         Inherits actual storage sizes from the previous month.
+        
+        Returns:
+            The month's statistics
         """
-        if month_key not in self.monthly_stats:
-            self.monthly_stats[month_key] = defaultdict(MonthlyStats)
+        month_stats = self.monthly_stats.get(month_key)
+        if month_stats is None:
             # Initialize new month's max_size with actual storage sizes from previous month
-            for s_name, eom_size in self.last_month_eom_storage_sizes.items():
-                self.monthly_stats[month_key][s_name].max_size = eom_size
+            max_size = list(self.last_month_eom_storage_sizes)
+            # Fees of every active unit, transposed into per-unit columns; update sums start at zero
+            unit_fees = [(0, 0, 0, 0)] * len(STORAGE_INDEX)
+            for idx in self._active_units:
+                unit_fees[idx] = _unit_fees(STORAGE_FEE_TERMS[idx], max_size[idx], 0)
+            fee_columns = [list(column) for column in zip(*unit_fees)]
+            month_stats = MonthlyStats(max_size, _per_unit_zeros(), *fee_columns)
+            self.monthly_stats[month_key] = month_stats
+            self._month_fee_totals[month_key] = [sum(column) for column in fee_columns]
+        return month_stats
+
+    def _update_fee_totals(self, month_key: str, month_stats: MonthlyStats, idx: int):
+        """
+        Recalculate one storage unit's fees after its statistics changed.
+        
+        Only the difference from the unit's previous contribution is applied
+        to the month's running totals, so the other storage units are not
+        revisited.
+        """
+        storage_fee, update_fee, storage_fee_scaled, update_fee_scaled = \
+            _unit_fees(STORAGE_FEE_TERMS[idx], month_stats.max_size[idx], month_stats.update_kb_sum[idx])
+        self._month_version[month_key] += 1
+        totals = self._month_fee_totals[month_key]
+        totals[0] += storage_fee - month_stats.storage_fee[idx]
+        totals[1] += update_fee - month_stats.update_fee[idx]
+        totals[2] += storage_fee_scaled - month_stats.storage_fee_scaled[idx]
+        totals[3] += update_fee_scaled - month_stats.update_fee_scaled[idx]
+        month_stats.storage_fee[idx] = storage_fee
+        month_stats.update_fee[idx] = update_fee
+        month_stats.storage_fee_scaled[idx] = storage_fee_scaled
+        month_stats.update_fee_scaled[idx] = update_fee_scaled
 
     def _would_exceed_free_plan_limit(self, month_key: str, 
-                                       op_storage_name: str, 
+                                       op_storage_index: int, 
+                                       op_month_stats: MonthlyStats,
                                        op_potential_max_size_kb: int, 
                                        op_kb_for_current_op: int 
                                        ) -> bool:
@@ -128,54 +250,31 @@ class StorageManager:
         Check if an operation would exceed the free plan's fee limit.
         
         This method simulates the operation and calculates the total integer fees
-        that would result. The free plan limit is exceeded if the sum of integer
-        storage and update fees would exceed 1000.
+        that would result, by adjusting the month's running totals for the change
+        in the operated storage unit's fees. The free plan limit is exceeded if the
+        sum of integer storage and update fees would exceed 1000.
         
         Args:
             month_key: The month being checked
-            op_storage_name: The storage unit for the operation
+            op_storage_index: STORAGE_INDEX position of the storage unit for the operation
+            op_month_stats: Current statistics of the month being checked
             op_potential_max_size_kb: Potential new max size after operation
             op_kb_for_current_op: Size impact of the current operation
             
+        Only called on the free plan; the paid plan has no fee limit.
+        
         Returns:
             bool: True if the operation would exceed the free plan limit
         """
-        if not self.is_free_plan:
-            return False
-
-        sim_total_integer_storage_fee = 0
-        sim_total_integer_update_fee = 0
-        
-        self._ensure_month_init(month_key) 
-        current_month_data = self.monthly_stats[month_key]
-
-        for s_name, s_unit in STORAGE_UNITS.items():
-            if not s_unit.is_free_plan_allowed:
-                continue
-            
-            s_stats = current_month_data[s_name] 
-            
-            # Simulate storage and update amounts after operation
-            current_s_max_size_kb_for_sim = s_stats.max_size
-            current_s_update_kb_sum_for_sim = s_stats.update_kb_sum
-
-            if s_name == op_storage_name:
-                current_s_max_size_kb_for_sim = op_potential_max_size_kb
-                current_s_update_kb_sum_for_sim += op_kb_for_current_op
-            
-            # Calculate integer storage fee
-            if current_s_max_size_kb_for_sim > 0:
-                s_mb_for_storage = math.ceil(current_s_max_size_kb_for_sim / self.KB_TO_MB_DIVISOR)
-                storage_fee_dec_item = Decimal(s_mb_for_storage) * s_unit.store_fee_per_mb
-                ceiled_storage_fee_item = math.ceil(storage_fee_dec_item)
-                sim_total_integer_storage_fee += ceiled_storage_fee_item
-            
-            # Calculate integer update fee
-            if current_s_update_kb_sum_for_sim > 0:
-                u_mb_for_fee = math.ceil(current_s_update_kb_sum_for_sim / self.KB_TO_MB_DIVISOR)
-                update_fee_dec_item = Decimal(u_mb_for_fee) * s_unit.update_fee_per_mb
-                ceiled_update_fee_item = math.ceil(update_fee_dec_item)
-                sim_total_integer_update_fee += ceiled_update_fee_item
+        total_storage_fee, total_update_fee, _, _ = self._month_fee_totals[month_key]
+
+        # Simulate the operation on its storage unit only; the other units'
+        # fees are already part of the running totals
+        idx = op_storage_index
+        sim_storage_fee, sim_update_fee, _, _ = _unit_fees(
+            STORAGE_FEE_TERMS[idx], op_potential_max_size_kb, op_month_stats.update_kb_sum[idx] + op_kb_for_current_op)
+        sim_total_integer_storage_fee = total_storage_fee - op_month_stats.storage_fee[idx] + sim_storage_fee
+        sim_total_integer_update_fee = total_update_fee - op_month_stats.update_fee[idx] + sim_update_fee
         
         return (sim_total_integer_storage_fee + sim_total_integer_update_fee) > 1000
 
@@ -185,57 +284,37 @@ class StorageManager:
         
         Calculates storage fees based on maximum storage used and
         update fees based on total update operations. For free plan,
-        only considers allowed storage units.
+        only considers allowed storage units. Reads the running totals
+        maintained by _update_fee_totals rather than revisiting each unit,
+        and reuses the previous result while the month is unchanged.
         
         Returns:
             Dict containing storage_fee, update_fee, and usage_fee
         """
-        self._ensure_month_init(month_key)
-        final_total_storage_fee, final_total_update_fee = 0, 0
-        total_storage_fee_dec_for_usage, total_update_fee_dec_for_usage = Decimal(0), Decimal(0)
-        
-        # Only consider allowed storage units for free plan
-        storages_to_check = [s_name for s_name, s_unit in STORAGE_UNITS.items()
-                             if not self.is_free_plan or s_unit.is_free_plan_allowed]
-        current_month_data = self.monthly_stats[month_key]
-
-        for s_name in storages_to_check:
-            s_unit = STORAGE_UNITS[s_name]
-            s_stats = current_month_data[s_name] 
-
-            # Calculate storage fee based on max size
-            if s_stats.max_size > 0:
-                s_mb = math.ceil(s_stats.max_size / self.KB_TO_MB_DIVISOR)
-                storage_fee_dec_item = Decimal(s_mb) * s_unit.store_fee_per_mb
-                final_total_storage_fee += math.ceil(storage_fee_dec_item)
-                total_storage_fee_dec_for_usage += storage_fee_dec_item
-
-            # Calculate update fee if not already settled
-            current_s_update_kb_sum_for_calc = s_stats.update_kb_sum
-            if month_key in self.update_fee_settled_for_month:
-                 current_s_update_kb_sum_for_calc = 0
-
-            if current_s_update_kb_sum_for_calc > 0:
-                u_mb = math.ceil(current_s_update_kb_sum_for_calc / self.KB_TO_MB_DIVISOR)
-                update_fee_dec_item = Decimal(u_mb) * s_unit.update_fee_per_mb
-                final_total_update_fee += math.ceil(update_fee_dec_item)
-
-            # Track update fees for usage calculation
-            if month_key in self.update_fee_settled_for_month: 
-                total_update_fee_dec_for_usage += Decimal(0)
-            elif s_stats.update_kb_sum > 0:
-                 u_mb_for_usage = math.ceil(s_stats.update_kb_sum / self.KB_TO_MB_DIVISOR)
-                 total_update_fee_dec_for_usage += Decimal(u_mb_for_usage) * s_unit.update_fee_per_mb
+        month_stats = self._ensure_month_init(month_key)
+        version = self._month_version[month_key]
+        cached = self._fee_cache.get(month_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        final_total_storage_fee, final_total_update_fee, storage_fee_scaled, update_fee_scaled = \
+            self._month_fee_totals[month_key]
+
+        # Update fees already settled by a CALC are not charged again
+        if month_stats.update_fee_settled:
+            final_total_update_fee, update_fee_scaled = 0, 0
                  
         # Calculate usage fee for free plan (amount exceeding 1000)
-        usage_fee = math.ceil(max(Decimal(0), total_storage_fee_dec_for_usage + total_update_fee_dec_for_usage - Decimal(1000)))
-        return {
+        usage_fee = max(0, -(-(storage_fee_scaled + update_fee_scaled - 1000 * FEE_SCALE) // FEE_SCALE))
+        total_fees = {
             "storage_fee": final_total_storage_fee,
             "update_fee": final_total_update_fee,
             "usage_fee": usage_fee,
         }
+        self._fee_cache[month_key] = (version, total_fees)
+        return total_fees
 
-    def handle_upload(self, timestamp: datetime, storage_name: str, file_name: str, size: int) -> str:
+    def handle_upload(self, year: int, month: int, storage_name: str, file_name: str, size: int) -> str:
         """
         Handle file upload operation.
         
@@ -246,21 +325,20 @@ class StorageManager:
             Status message with operation result and fees if successful
         """
         if file_name in self.files: return "UPLOAD: file already exists"
-        if storage_name not in STORAGE_UNITS: return "UPLOAD: invalid storage name"
-        unit = STORAGE_UNITS[storage_name]
-        if self.is_free_plan and not unit.is_free_plan_allowed:
+        idx = self._plan_storage_index.get(storage_name)
+        if idx is None:
+            if storage_name not in STORAGE_UNITS: return "UPLOAD: invalid storage name"
             return "UPLOAD: this storage location is not available on the free plan"
         
-        month_key = self._get_month_key(timestamp)
-        self._ensure_month_init(month_key) 
+        month_key = _month_key(year, month)
+        month_stats = self._ensure_month_init(month_key)
 
         # Check free plan limits
         if self.is_free_plan:
-            current_stats_for_op_storage = self.monthly_stats[month_key][storage_name]
             simulated_current_total_size_for_op_storage = self.current_storage_size.get(storage_name, 0) + size
-            potential_max_size_kb = max(current_stats_for_op_storage.max_size, simulated_current_total_size_for_op_storage)
+            potential_max_size_kb = max(month_stats.max_size[idx], simulated_current_total_size_for_op_storage)
             
-            if self._would_exceed_free_plan_limit(month_key, storage_name, 
+            if self._would_exceed_free_plan_limit(month_key, idx, month_stats,
                                                  op_potential_max_size_kb=potential_max_size_kb, 
                                                  op_kb_for_current_op=size):
                 return "UPLOAD: free plan fee limit exceeded"
@@ -268,14 +346,14 @@ class StorageManager:
         # Perform upload and update statistics
         self.files[file_name] = File(file_name, size, storage_name)
         self.current_storage_size[storage_name] += size
-        stats_to_update = self.monthly_stats[month_key][storage_name]
-        stats_to_update.max_size = max(stats_to_update.max_size, self.current_storage_size[storage_name])
-        stats_to_update.update_kb_sum += size 
+        month_stats.max_size[idx] = max(month_stats.max_size[idx], self.current_storage_size[storage_name])
+        month_stats.update_kb_sum[idx] += size 
+        self._update_fee_totals(month_key, month_stats, idx)
         
         total_fees = self._calculate_total_fees(month_key)
-        return f"UPLOAD: {total_fees['storage_fee']} {total_fees['update_fee']} {total_fees['usage_fee']}"
+        return UPLOAD_RESPONSE % (total_fees['storage_fee'], total_fees['update_fee'], total_fees['usage_fee'])
 
-    def handle_delete(self, timestamp: datetime, storage_name: str, file_name: str) -> str:
+    def handle_delete(self, year: int, month: int, storage_name: str, file_name: str) -> str:
         """
         Handle file deletion operation.
         
@@ -285,12 +363,12 @@ class StorageManager:
         Returns:
             Status message with operation result and fees if successful
         """
-        month_key = self._get_month_key(timestamp) 
-        self._ensure_month_init(month_key) 
-        if storage_name not in STORAGE_UNITS:
-             return f"DELETE: invalid storage name" 
-        unit = STORAGE_UNITS[storage_name]
-        if self.is_free_plan and not unit.is_free_plan_allowed:
+        month_key = _month_key(year, month) 
+        month_stats = self._ensure_month_init(month_key)
+        idx = self._plan_storage_index.get(storage_name)
+        if idx is None:
+            if storage_name not in STORAGE_UNITS:
+                return "DELETE: invalid storage name"
             return "DELETE: this storage location is not available on the free plan"
         if file_name not in self.files: 
             return "DELETE: file does not exist" 
@@ -301,11 +379,10 @@ class StorageManager:
         
         # Check free plan limits
         if self.is_free_plan:
-            current_stats_for_op_storage = self.monthly_stats[month_key][storage_name]
             # Delete operation doesn't increase max_size
-            potential_max_size_kb = current_stats_for_op_storage.max_size
+            potential_max_size_kb = month_stats.max_size[idx]
             # Update amount for delete is the size of deleted file
-            if self._would_exceed_free_plan_limit(month_key, storage_name,
+            if self._would_exceed_free_plan_limit(month_key, idx, month_stats,
                                                  op_potential_max_size_kb=potential_max_size_kb, 
                                                  op_kb_for_current_op=deleted_file_size):
                 return "DELETE: free plan fee limit exceeded"
@@ -313,12 +390,12 @@ class StorageManager:
         # Perform deletion and update statistics
         self.current_storage_size[file.storage] -= deleted_file_size
         del self.files[file_name]
-        stats_to_update = self.monthly_stats[month_key][storage_name]
-        stats_to_update.update_kb_sum += deleted_file_size 
+        month_stats.update_kb_sum[idx] += deleted_file_size 
+        self._update_fee_totals(month_key, month_stats, idx)
         total_fees = self._calculate_total_fees(month_key)
-        return f"DELETE: {total_fees['storage_fee']} {total_fees['update_fee']} {total_fees['usage_fee']}"
+        return DELETE_RESPONSE % (total_fees['storage_fee'], total_fees['update_fee'], total_fees['usage_fee'])
 
-    def handle_update(self, timestamp: datetime, storage_name: str, file_name: str, new_size: int) -> str:
+    def handle_update(self, year: int, month: int, storage_name: str, file_name: str, new_size: int) -> str:
         """
         Handle file update operation.
         
@@ -329,12 +406,12 @@ class StorageManager:
         Returns:
             Status message with operation result and fees if successful
         """
-        month_key = self._get_month_key(timestamp)
-        self._ensure_month_init(month_key)
-        if storage_name not in STORAGE_UNITS:
-            return f"UPDATE: invalid storage name"
-        unit = STORAGE_UNITS[storage_name]
-        if self.is_free_plan and not unit.is_free_plan_allowed:
+        month_key = _month_key(year, month)
+        month_stats = self._ensure_month_init(month_key)
+        idx = self._plan_storage_index.get(storage_name)
+        if idx is None:
+            if storage_name not in STORAGE_UNITS:
+                return "UPDATE: invalid storage name"
             return "UPDATE: this storage location is not available on the free plan"
         if file_name not in self.files:
             return "UPDATE: file does not exist"
@@ -345,27 +422,26 @@ class StorageManager:
         
         # Check free plan limits
         if self.is_free_plan:
-            current_stats_for_op_storage = self.monthly_stats[month_key][storage_name]
             # Calculate new storage size after update
             simulated_current_total_size_for_op_storage = self.current_storage_size.get(storage_name,0) + (new_size - original_size_of_file_being_updated)
-            potential_max_size_kb = max(current_stats_for_op_storage.max_size, simulated_current_total_size_for_op_storage)
+            potential_max_size_kb = max(month_stats.max_size[idx], simulated_current_total_size_for_op_storage)
             # Update amount is sum of original and new sizes
-            if self._would_exceed_free_plan_limit(month_key, storage_name, 
+            if self._would_exceed_free_plan_limit(month_key, idx, month_stats,
                                                  op_potential_max_size_kb=potential_max_size_kb, 
                                                  op_kb_for_current_op=original_size_of_file_being_updated + new_size): 
                 return "UPDATE: free plan fee limit exceeded" 
                 
         # Perform update and update statistics
         self.current_storage_size[storage_name] += (new_size - original_size_of_file_being_updated)
-        stats_to_update = self.monthly_stats[month_key][storage_name]
-        stats_to_update.max_size = max(stats_to_update.max_size, self.current_storage_size[storage_name])
-        stats_to_update.update_kb_sum += (original_size_of_file_being_updated + new_size)
+        month_stats.max_size[idx] = max(month_stats.max_size[idx], self.current_storage_size[storage_name])
+        month_stats.update_kb_sum[idx] += (original_size_of_file_being_updated + new_size)
+        self._update_fee_totals(month_key, month_stats, idx)
         file.size = new_size
         
         total_fees = self._calculate_total_fees(month_key)
-        return f"UPDATE: {total_fees['storage_fee']} {total_fees['update_fee']} {total_fees['usage_fee']}"
+        return UPDATE_RESPONSE % (total_fees['storage_fee'], total_fees['update_fee'], total_fees['usage_fee'])
 
-    def handle_calc(self, timestamp: datetime) -> str:
+    def handle_calc(self, year: int, month: int) -> str:
         """
         Handle calculation operation for previous month's fees.
         
@@ -375,29 +451,38 @@ class StorageManager:
         Returns:
             Status message with storage sizes and fees
         """
-        month_key = self._get_previous_month_key(timestamp)
+        month_key = _prev_month_key(year, month)
         total_fees = self._calculate_total_fees(month_key)
 
         # Take snapshot of current storage sizes if not already taken
         if month_key not in self.calc_reported_sizes_snapshot:
-            current_snapshot = {}
-            for s_name in STORAGE_UNITS.keys():
-                current_snapshot[s_name] = self.current_storage_size.get(s_name, 0)
-                # Update end-of-month sizes for next month's initialization
-                self.last_month_eom_storage_sizes[s_name] = self.current_storage_size.get(s_name, 0)
+            current_snapshot = tuple(self.current_storage_size.get(s_name, 0) for s_name in STORAGE_INDEX)
+            # Update end-of-month sizes for next month's initialization
+            self.last_month_eom_storage_sizes = list(current_snapshot)
             self.calc_reported_sizes_snapshot[month_key] = current_snapshot
 
-        # Report storage sizes and fees
-        reported_sizes = self.calc_reported_sizes_snapshot[month_key]
-        report_kb_a1 = reported_sizes.get('storage_A1', 0)
-        report_kb_a2 = reported_sizes.get('storage_A2', 0)
-        report_kb_b1 = reported_sizes.get('storage_B1', 0)
-        report_kb_b2 = reported_sizes.get('storage_B2', 0)
+        # Report storage sizes (A1, A2, B1, B2 in STORAGE_INDEX order) and fees
+        report_kb_a1, report_kb_a2, report_kb_b1, report_kb_b2 = self.calc_reported_sizes_snapshot[month_key]
 
-        self.update_fee_settled_for_month.add(month_key)
+        self.monthly_stats[month_key].update_fee_settled = True
+        self._month_version[month_key] += 1
+
+        return CALC_RESPONSE % (report_kb_a1, report_kb_a2, report_kb_b1, report_kb_b2,
+                                total_fees['storage_fee'], total_fees['update_fee'], total_fees['usage_fee'])
+
+# Command handlers keyed by operation, with the exact token count each command expects
+COMMAND_DISPATCH = {
+    'UPLOAD': (5, lambda manager, year, month, parts: manager.handle_upload(
+        year, month, storage_name=parts[2], file_name=parts[3], size=int(parts[4]))),
+    'DELETE': (4, lambda manager, year, month, parts: manager.handle_delete(
+        year, month, storage_name=parts[2], file_name=parts[3])),
+    'UPDATE': (5, lambda manager, year, month, parts: manager.handle_update(
+        year, month, storage_name=parts[2], file_name=parts[3], new_size=int(parts[4]))),
+    'CALC': (2, lambda manager, year, month, parts: manager.handle_calc(year, month)),
+}
 
-        return (f"CALC: [{report_kb_a1} {report_kb_a2} {report_kb_b1} {report_kb_b2}] "
-                f"{total_fees['storage_fee']} {total_fees['update_fee']} {total_fees['usage_fee']}")
+# Longest valid command has 5 tokens; one more tells an overlong command apart
+MAX_COMMAND_SPLITS = 5
 
 def process_command(manager: StorageManager, command: str) -> str:
     """
@@ -413,21 +498,17 @@ def process_command(manager: StorageManager, command: str) -> str:
     Returns:
         Result message from the operation handler
     """
-    parts = command.strip().split()
+    parts = command.split(None, MAX_COMMAND_SPLITS)
     if not parts: return "ERROR: empty command"
     try:
+        # Only the year and month of the timestamp drive the fee logic
         timestamp = datetime.fromisoformat(parts[0])
+        year, month = timestamp.year, timestamp.month
         cmd_type = parts[1].upper()
-        if cmd_type == 'UPLOAD' and len(parts) == 5:
-            return manager.handle_upload(timestamp, storage_name=parts[2], file_name=parts[3], size=int(parts[4]))
-        elif cmd_type == 'DELETE' and len(parts) == 4:
-            return manager.handle_delete(timestamp, storage_name=parts[2], file_name=parts[3])
-        elif cmd_type == 'UPDATE' and len(parts) == 5:
-            return manager.handle_update(timestamp, storage_name=parts[2], file_name=parts[3], new_size=int(parts[4]))
-        elif cmd_type == 'CALC' and len(parts) == 2:
-            return manager.handle_calc(timestamp)
-        else:
+        expected_len, handler = COMMAND_DISPATCH.get(cmd_type, (0, None))
+        if len(parts) != expected_len:
             return f"{cmd_type}: invalid command format"
+        return handler(manager, year, month, parts)
     except (ValueError, IndexError):
         return "ERROR: invalid command format or value"
 
@@ -436,12 +517,13 @@ def main():
     Main entry point.
     
     Creates a StorageManager instance and processes commands
-    from standard input.
+    from standard input, writing one result line per command.
     """
     manager = StorageManager(is_free_plan=True)
-    for line in sys.stdin:
-        if line.strip():
-            print(process_command(manager, line))
+    # Read all input at once and write the results in a single call
+    output = [process_command(manager, line) for line in sys.stdin.read().split('\n') if line.strip()]
+    if output:
+        sys.stdout.write('\n'.join(output) + '\n')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file